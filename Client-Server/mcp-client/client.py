@@ -1,23 +1,51 @@
 import asyncio
+import json
 import sys
-from typing import Optional
+import time
+from collections import OrderedDict
+from typing import Any, Optional
 from contextlib import AsyncExitStack
 
 from mcp import ClientSession, StdioServerParameters
 from mcp.client.stdio import stdio_client
 
-from anthropic import Anthropic
+import jsonschema
+from anthropic import AsyncAnthropic, BadRequestError
 from dotenv import load_dotenv
 
 load_dotenv()  # load environment variables from .env
 
 
+# Tool result cache limits; weather data goes stale quickly
+TOOL_CACHE_SIZE = 256
+TOOL_CACHE_TTL = 60.0
+
+# History limits that keep the prompt within the model's context window:
+# only the last MAX_HISTORY_QUERIES exchanges are kept, and tool results
+# from earlier exchanges are replaced by a short placeholder
+MAX_HISTORY_QUERIES = 10
+ELIDED_TOOL_RESULT = "[tool result omitted from conversation history]"
+
+
+async def ainput(prompt: str = "") -> str:
+    """Read a line from stdin in a worker thread so the event loop keeps running"""
+    return await asyncio.get_running_loop().run_in_executor(None, input, prompt)
+
+
 class MCPClient:
     def __init__(self):
         # Initialize session and client objects
         self.session: Optional[ClientSession] = None
         self.exit_stack = AsyncExitStack()
-        self.anthropic = Anthropic()
+        self.anthropic = AsyncAnthropic()
+        # Tool schemas in Anthropic format, fetched once per connection
+        self._available_tools: list = []
+        # Compiled input schema validators by tool name, so bad arguments never reach the server
+        self._validators: dict[str, jsonschema.Draft7Validator] = {}
+        # Conversation history, kept across queries until /reset (bounded by _compact_history)
+        self.messages: list = []
+        # Recent tool results keyed by (tool_name, canonical JSON args), in LRU order
+        self._tool_cache: OrderedDict[tuple[str, str], tuple[float, Any]] = OrderedDict()
         # methods will go here
 
     async def connect_to_server(self, server_script_path: str):
@@ -45,117 +73,214 @@ class MCPClient:
         await self.session.initialize()
 
         # List available tools
-        response = await self.session.list_tools()
-        tools = response.tools
-        print("\nConnected to server with tools:", [tool.name for tool in tools])
-
-    async def process_query(self, query: str) -> str:
-        """Process a query using Claude and available tools"""
-        messages = [
-            {
-                "role": "user",
-                "content": query
-            }
-        ]
+        await self.refresh_tools()
+        print("\nConnected to server with tools:", [tool["name"] for tool in self._available_tools])
 
+    async def refresh_tools(self):
+        """Re-fetch the server's tool list, e.g. after the tool set changes"""
         response = await self.session.list_tools()
-        available_tools = [{
+        self._available_tools = [{
             "name": tool.name,
             "description": tool.description,
             "input_schema": tool.inputSchema
         } for tool in response.tools]
+        self._validators = {tool.name: jsonschema.Draft7Validator(tool.inputSchema) for tool in response.tools}
+        # The tool list is constant between refreshes, so mark it as a cacheable
+        # prompt prefix; the breakpoint on the last tool covers the whole list
+        if self._available_tools:
+            self._available_tools[-1]["cache_control"] = {"type": "ephemeral"}
 
-        # Initial Claude API call
-        response = self.anthropic.messages.create(
-            model="claude-3-5-sonnet-20241022",
-            max_tokens=1000,
-            messages=messages,
-            tools=available_tools
-        )
-        # Process response and handle tool calls
-        final_text = []
+    async def _call_tool(self, tool_name: str, tool_args: dict):
+        """Call a tool, reusing a recent result for identical arguments
 
-        # Keep track of all content to build the conversation
-        while True:
-            # Process the current response
-            tool_call_found = False
-            tool_name = ""
-            tool_args = {}
-            tool_use_id = ""
-
-            for content in response.content:
-                if content.type == 'text':
-                    final_text.append(content.text)
-                elif content.type == 'tool_use':
-                    tool_call_found = True
-                    tool_name = content.name
-                    tool_args = content.input
-                    tool_use_id = content.id
-
-                    # Log the tool call
-                    final_text.append(f"[Calling tool {tool_name} with args {tool_args}]")
-                    # Execute tool call
-                    try:
-                        result = await self.session.call_tool(tool_name, tool_args)
-                        tool_result = ""
-                        if result and result.content:
-                            tool_result = result.content
-                        # Don't add tool result to final_text as it will be processed by Claude
-                    except Exception as e:
-                        tool_result = f"Error calling tool {tool_name}: {str(e)}"
-                        final_text.append(tool_result)
+        Raises:
+            ValueError: If the arguments don't match the tool's input schema
+        """
+        validator = self._validators.get(tool_name)
+        if validator is not None:
+            error = next(validator.iter_errors(tool_args), None)
+            if error is not None:
+                raise ValueError(f"Schema validation failed: {error.message}")
+
+        key = (tool_name, json.dumps(tool_args, sort_keys=True))
+        cached = self._tool_cache.get(key)
+        if cached is not None:
+            expires_at, result = cached
+            if expires_at >= time.monotonic():
+                self._tool_cache.move_to_end(key)
+                return result
+            del self._tool_cache[key]
+
+        result = await self.session.call_tool(tool_name, tool_args)
+        # Don't cache failures so they can be retried
+        if result and not result.isError:
+            self._tool_cache[key] = (time.monotonic() + TOOL_CACHE_TTL, result)
+            self._tool_cache.move_to_end(key)
+            if len(self._tool_cache) > TOOL_CACHE_SIZE:
+                self._tool_cache.popitem(last=False)
+        return result
+
+    async def _stream_message(self, messages: list):
+        """Stream a Claude response, printing text and starting tool calls as they arrive
+
+        Returns:
+            The final message and a dict mapping tool_use ids to running call_tool tasks
+        """
+        tool_tasks = {}
+        try:
+            async with self.anthropic.messages.stream(
+                model="claude-3-5-sonnet-20241022",
+                max_tokens=1000,
+                messages=messages,
+                tools=self._available_tools
+            ) as stream:
+                async for event in stream:
+                    if event.type == 'text':
+                        print(event.text, end="", flush=True)
+                    elif event.type == 'content_block_stop' and event.content_block.type == 'tool_use':
+                        # Dispatch the tool as soon as its arguments are complete
+                        block = event.content_block
+                        print(f"\n[Calling tool {block.name} with args {block.input}]", flush=True)
+                        tool_tasks[block.id] = asyncio.create_task(self._call_tool(block.name, block.input))
+                response = await stream.get_final_message()
+        except BaseException:
+            # Nobody will await these now; stop them and discard their outcomes
+            for task in tool_tasks.values():
+                task.cancel()
+                task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            raise
+        return response, tool_tasks
 
-                    # Add assistant's message with tool use
-                    messages.append({
-                        "role": "assistant",
-                        "content": response.content
-                    })
+    async def process_query(self, query: str) -> str:
+        """Process a query using Claude and available tools"""
+        messages = self.messages
+        # Roll back to here if the exchange fails, so history never holds a half-finished turn
+        history_len = len(messages)
+        try:
+            messages.append({
+                "role": "user",
+                "content": query
+            })
 
-                    # Add tool result
-                    messages.append({
-                        "role": "user",
-                        "content": [{
-                            "type": "tool_result",
-                            "tool_use_id": tool_use_id,
-                            "content": tool_result,
-                        }]
+            # Initial Claude API call
+            response, tool_tasks = await self._stream_message(messages)
+            # Process response and handle tool calls
+            final_text = []
+
+            # Keep calling Claude until it answers without requesting any tools
+            while True:
+                # Add assistant's message, including any tool use
+                messages.append({
+                    "role": "assistant",
+                    "content": response.content
+                })
+
+                tool_uses = []
+                for content in response.content:
+                    if content.type == 'text':
+                        final_text.append(content.text)
+                    elif content.type == 'tool_use':
+                        tool_uses.append(content)
+                        # Log the tool call
+                        final_text.append(f"[Calling tool {content.name} with args {content.input}]")
+
+                if not tool_uses:
+                    break
+
+                # Wait for the tool calls, which were started concurrently while the response was streaming.
+                # A tool_use block cut off mid-stream (e.g. at max_tokens) was never dispatched.
+                done = iter(await asyncio.gather(
+                    *(tool_tasks[content.id] for content in tool_uses if content.id in tool_tasks),
+                    return_exceptions=True
+                ))
+                results = [
+                    next(done) if content.id in tool_tasks
+                    else RuntimeError("the tool call was cut off before its arguments were complete")
+                    for content in tool_uses
+                ]
+                tool_results = []
+                for content, result in zip(tool_uses, results):
+                    if isinstance(result, Exception):
+                        tool_result = f"Error calling tool {content.name}: {str(result)}"
+                        is_error = True
+                        final_text.append(tool_result)
+                        # Errors are not part of the streamed output, so show them here
+                        print(f"\n{tool_result}", flush=True)
+                    else:
+                        # Don't add tool result to final_text as it will be processed by Claude
+                        tool_result = result.content if result and result.content else ""
+                        # Tools report failures through isError
+                        is_error = bool(result and result.isError)
+                    tool_results.append({
+                        "type": "tool_result",
+                        "tool_use_id": content.id,
+                        "content": tool_result,
+                        "is_error": is_error,
                     })
 
-                    # Get next response from Claude after tool call
-                    response = self.anthropic.messages.create(
-                        model="claude-3-5-sonnet-20241022",
-                        max_tokens=1000,
-                        messages=messages,
-                        tools=available_tools
-                    )
-                    break
-                
+                # Add all tool results in a single user turn
+                messages.append({
+                    "role": "user",
+                    "content": tool_results
+                })
 
-            # No tool calls found, add message and exit loop
-            messages.append({
-                "role": "assistant",
-                "content": response.content[0].text if response.content and len(response.content) > 0 and hasattr(response.content[0], 'text') else ""
-            })
-            # Final response already added to final_text in the loop above
-            break
-        print("final_text", final_text)
+                # Get next response from Claude after the tool calls
+                response, tool_tasks = await self._stream_message(messages)
+        except BaseException:
+            del messages[history_len:]
+            raise
+
+        self._compact_history()
         return "\n".join(final_text)
 
+    def _compact_history(self):
+        """Bound the conversation history so prompts don't outgrow the context window"""
+        # Each exchange starts with the user's query, the only user message with plain string content
+        starts = [i for i, message in enumerate(self.messages)
+                  if message["role"] == "user" and isinstance(message["content"], str)]
+        if len(starts) > MAX_HISTORY_QUERIES:
+            del self.messages[:starts[-MAX_HISTORY_QUERIES]]
+        if not starts:
+            return
+
+        # Tool results can be very large (e.g. full alert lists); keep them only for the latest exchange
+        latest = max(i for i, message in enumerate(self.messages)
+                     if message["role"] == "user" and isinstance(message["content"], str))
+        for message in self.messages[:latest]:
+            if message["role"] == "user" and isinstance(message["content"], list):
+                message["content"] = [
+                    {**block, "content": ELIDED_TOOL_RESULT} if block.get("type") == "tool_result" else block
+                    for block in message["content"]
+                ]
+
     async def chat_loop(self):
         """Run an interactive chat loop"""
         print("\nMCP Client Started!")
-        print("Type your queries or 'quit' to exit.")
+        print("Type your queries, '/reset' to clear the conversation, '/reset-cache' to drop cached tool results, or 'quit' to exit.")
 
         while True:
             try:
-                query = input("\nQuery: ").strip()
+                query = (await ainput("\nQuery: ")).strip()
 
                 if query.lower() == 'quit':
                     break
-
-                response = await self.process_query(query)
-                print("\n" + response)
-
+                if query.lower() == '/reset':
+                    self.messages.clear()
+                    print("Conversation history cleared.")
+                    continue
+                if query.lower() == '/reset-cache':
+                    self._tool_cache.clear()
+                    print("Tool result cache cleared.")
+                    continue
+
+                # The response is printed as it streams in
+                await self.process_query(query)
+                print()
+
+            except BadRequestError as e:
+                # Most often the conversation has outgrown the model's context window
+                print(f"\nError: {str(e)}")
+                print("If the conversation is too long, type '/reset' to clear it.")
             except Exception as e:
                 print(f"\nError: {str(e)}")
 
@@ -178,4 +303,9 @@ async def main():
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    try:
+        import uvloop  # Faster libuv-based event loop; not available on Windows
+    except ImportError:
+        asyncio.run(main())
+    else:
+        uvloop.run(main())
@@ -1,84 +1,236 @@
+import asyncio # For the request semaphore and retry backoff
+import atexit # For flushing queued log records on exit
+import logging
+import logging.handlers
+import queue
 import sys # For printing to stderr
-import traceback # For detailed error logging
-from typing import Any, Dict, Optional # Use Dict for clarity
+import time # For cache expiry
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Hashable, List, Optional, Tuple # Use Dict for clarity
 import httpx
-import json # For JSONDecodeError
+import msgspec # Fast JSON decoding, with typed decoding that skips unneeded fields of large payloads
 from mcp.server.fastmcp import FastMCP
-
-# Initialize FastMCP server
-mcp = FastMCP("weather")
+from mcp.server.fastmcp.exceptions import ToolError
 
 # Constants
 NWS_API_BASE = "https://api.weather.gov"
 # Be specific with User-Agent as requested by NWS: (YourApp/Version ContactEmailOrURL)
 USER_AGENT = "MCPWeatherApp/1.0 (github.com/your-repo-or-contact)"
+# Headers sent with every NWS request
+_HEADERS = {
+    "User-Agent": USER_AGENT,
+    "Accept": "application/geo+json"
+}
+# Content types accepted from the NWS API
+_OK_CT = ("application/geo+json", "application/ld+json")
+# Upper bound on an NWS response body; larger responses are rejected unread
+MAX_RESPONSE_BYTES = 50 * 1024 * 1024
+
+class TTLCache:
+    """A small LRU cache whose entries expire after a fixed time-to-live.
+
+    Not thread-safe, but safe under asyncio: get() and set() never await.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Any:
+        """Return the cached value for key, or None if missing or expired."""
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any):
+        """Store value under key, evicting the least recently used entry if full."""
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        """Drop all cached entries."""
+        self._data.clear()
+
+# /points lookups map a coordinate to its forecast grid, which rarely changes
+_points_cache = TTLCache(maxsize=4096, ttl=6 * 3600)
+# Active alerts change often; only absorb bursts of repeated calls
+_alerts_cache = TTLCache(maxsize=64, ttl=60)
+
+# Bound in-flight NWS requests to respect rate limits and avoid connection pile-up
+_NWS_SEMAPHORE = asyncio.Semaphore(8)
+# Transient server errors worth retrying, with exponential backoff starting at NWS_RETRY_BACKOFF seconds
+NWS_RETRY_STATUSES = frozenset({500, 502, 503, 504})
+NWS_MAX_RETRIES = 3
+NWS_RETRY_BACKOFF = 0.5
+
+# Shared HTTP client so consecutive NWS requests reuse pooled keep-alive connections
+_client: Optional[httpx.AsyncClient] = None
+
+def get_client() -> httpx.AsyncClient:
+    """Return the shared NWS HTTP client, creating it on first use."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            headers=_HEADERS,
+            follow_redirects=True, # Follow redirects
+            timeout=20.0, # Slightly shorter timeout
+            # Retries here cover connection failures; 5xx responses are retried in make_nws_request
+            transport=httpx.AsyncHTTPTransport(
+                http2=True,
+                retries=3,
+                limits=httpx.Limits(max_connections=16, max_keepalive_connections=8, keepalive_expiry=60),
+            ),
+        )
+    return _client
+
+async def close_client():
+    """Close the shared NWS HTTP client, if one was created."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+@asynccontextmanager
+async def server_lifespan(server: FastMCP) -> AsyncIterator[None]:
+    """Release the shared HTTP client when the server shuts down."""
+    try:
+        yield
+    finally:
+        await close_client()
+
+# Initialize FastMCP server
+mcp = FastMCP("weather", lifespan=server_lifespan)
+
+# --- Logging ---
+# Records are queued and written to stderr by a background thread, so logging
+# from request handlers never blocks the event loop on stderr I/O.
+# (stdout is reserved for the MCP stdio transport.)
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.propagate = False
+_log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+logger.addHandler(logging.handlers.QueueHandler(_log_queue))
+_stderr_handler = logging.StreamHandler(sys.stderr)
+_stderr_handler.setFormatter(logging.Formatter("SERVER %(levelname)s: %(message)s"))
+_log_listener = logging.handlers.QueueListener(_log_queue, _stderr_handler)
+_log_listener.start()
+atexit.register(_log_listener.stop)
 
-# --- Logging Helper ---
 def log_error(message: str):
     """Logs an error message to stderr."""
-    print(f"SERVER ERROR: {message}", file=sys.stderr)
-
-async def make_nws_request(url: str) -> Optional[Dict[str, Any]]:
-    """Make a request to the NWS API with proper error handling."""
-    headers = {
-        "User-Agent": USER_AGENT,
-        "Accept": "application/geo+json"
-    }
+    logger.error(message)
+
+async def make_nws_request(url: str, decode: Callable[[bytes], Any] = msgspec.json.decode) -> Any:
+    """Make a request to the NWS API with proper error handling.
+
+    Safe to run concurrently (e.g. via asyncio.gather): all calls share the
+    pooled client returned by get_client().
+
+    Args:
+        url: The NWS API URL to fetch
+        decode: Decoder for the raw response body (defaults to generic JSON)
+    """
     # Add basic logging for the request
-    print(f"SERVER INFO: Making NWS request to {url}", file=sys.stderr)
-    async with httpx.AsyncClient(follow_redirects=True) as client: # Follow redirects
-        try:
-            response = await client.get(url, headers=headers, timeout=20.0) # Slightly shorter timeout
-            response.raise_for_status() # Raise HTTPStatusError for 4xx/5xx
-            # Check content type before decoding JSON
-            content_type = response.headers.get("content-type", "")
-            if "application/geo+json" not in content_type and "application/ld+json" not in content_type:
-                 log_error(f"Unexpected content type received from {url}: {content_type}")
-                 # Optionally return the raw text if needed, or None/error
-                 # return {"error": "Unexpected content type", "content": response.text}
-                 return None
-            data = response.json()
-            print(f"SERVER INFO: Successfully fetched data from {url}", file=sys.stderr)
-            return data
-        except httpx.HTTPStatusError as e:
-            log_error(f"HTTP error fetching {url}: Status {e.response.status_code} - Response: {e.response.text[:200]}...")
-            return None
-        except httpx.RequestError as e:
-            log_error(f"Network error fetching {url}: {e}")
-            return None
-        except json.JSONDecodeError as e:
-            log_error(f"JSON decode error fetching {url}: {e} - Response Text: {response.text[:200]}...")
-            return None
-        except Exception as e:
-            # Catch any other unexpected errors
-            log_error(f"Unexpected error during NWS request to {url}: {e}")
-            traceback.print_exc(file=sys.stderr) # Print full traceback for unexpected errors
-            return None
+    logger.info("Making NWS request to %s", url)
+    try:
+        for attempt in range(NWS_MAX_RETRIES + 1):
+            # Hold a permit only while a request is in flight, not during backoff
+            async with _NWS_SEMAPHORE:
+                async with get_client().stream("GET", url) as response:
+                    # Refuse absurdly large bodies before downloading them
+                    content_length = response.headers.get("content-length", "")
+                    if content_length.isdigit() and int(content_length) > MAX_RESPONSE_BYTES:
+                        log_error(f"Response from {url} too large: {content_length} bytes")
+                        return None
+                    await response.aread()
+            if response.status_code not in NWS_RETRY_STATUSES or attempt == NWS_MAX_RETRIES:
+                break
+            delay = NWS_RETRY_BACKOFF * 2 ** attempt
+            log_error(f"NWS returned {response.status_code} for {url}; retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+        response.raise_for_status() # Raise HTTPStatusError for 4xx/5xx
+        # Check content type before decoding JSON
+        content_type = response.headers.get("content-type", "")
+        if not any(ct in content_type for ct in _OK_CT):
+             log_error(f"Unexpected content type received from {url}: {content_type}")
+             # Optionally return the raw text if needed, or None/error
+             # return {"error": "Unexpected content type", "content": response.text}
+             return None
+        data = decode(response.content)
+        logger.info("Successfully fetched data from %s", url)
+        return data
+    except httpx.HTTPStatusError as e:
+        log_error(f"HTTP error fetching {url}: Status {e.response.status_code} - Response bytes: {e.response.content[:200]!r}...")
+        return None
+    except httpx.RequestError as e:
+        log_error(f"Network error fetching {url}: {e}")
+        return None
+    except msgspec.DecodeError as e:
+        # msgspec.ValidationError (wrong structure) is a subclass of msgspec.DecodeError
+        log_error(f"JSON decode error fetching {url}: {e} - Response bytes: {response.content[:200]!r}...")
+        return None
+    except Exception as e:
+        # Catch any other unexpected errors
+        logger.exception(f"Unexpected error during NWS request to {url}: {e}") # Includes the full traceback
+        return None
 
-def format_alert(feature: Dict[str, Any]) -> str:
+# Typed views of an /alerts response. Decoding into these skips everything
+# format_alert doesn't use (geometry, geocodes, affected zones, ...), which
+# dominates the size of large alert payloads.
+NO_INSTRUCTIONS = "No specific instructions provided"
+
+class AlertProperties(msgspec.Struct):
+    """The alert properties shown by format_alert, in display order."""
+    event: Optional[str] = "Unknown"
+    areaDesc: Optional[str] = "Unknown"
+    severity: Optional[str] = "Unknown"
+    certainty: Optional[str] = "Unknown"
+    urgency: Optional[str] = "Unknown"
+    headline: Optional[str] = "N/A"
+    description: Optional[str] = "No description available"
+    instruction: Optional[str] = NO_INSTRUCTIONS
+    effective: Optional[str] = "N/A"
+    expires: Optional[str] = "N/A"
+
+class AlertFeature(msgspec.Struct):
+    properties: AlertProperties = msgspec.field(default_factory=AlertProperties)
+
+class AlertCollection(msgspec.Struct):
+    features: List[AlertFeature]
+
+_decode_alerts = msgspec.json.Decoder(AlertCollection).decode
+
+_ALERT_TEMPLATE = """
+Event: {}
+Area: {}
+Severity: {}
+Certainty: {}
+Urgency: {}
+Headline: {}
+Description: {}
+Instructions: {}
+Effective: {}
+Expires: {}
+""".format
+
+def format_alert(feature: AlertFeature) -> str:
     """Format an alert feature into a readable string."""
-    # Use .get() for safer access to potentially missing properties
-    props = feature.get("properties", {})
+    # Missing properties already hold their defaults from AlertProperties
+    values = list(msgspec.structs.astuple(feature.properties))
     # Use .strip() to remove leading/trailing whitespace from API descriptions
-    description = props.get('description', 'No description available').strip()
-    instruction = props.get('instruction', 'No specific instructions provided')
-    if instruction:
-        instruction = instruction.strip()
-    else:
-        instruction = 'No specific instructions provided'
-
-    return f"""
-Event: {props.get('event', 'Unknown')}
-Area: {props.get('areaDesc', 'Unknown')}
-Severity: {props.get('severity', 'Unknown')}
-Certainty: {props.get('certainty', 'Unknown')}
-Urgency: {props.get('urgency', 'Unknown')}
-Headline: {props.get('headline', 'N/A')}
-Description: {description if description else 'N/A'}
-Instructions: {instruction if instruction else 'N/A'}
-Effective: {props.get('effective', 'N/A')}
-Expires: {props.get('expires', 'N/A')}
-"""
+    values[6] = (values[6] or "").strip() or "N/A"
+    values[7] = (values[7] or NO_INSTRUCTIONS).strip() or "N/A"
+    return _ALERT_TEMPLATE(*values)
 
 @mcp.tool()
 async def get_alerts(state: str) -> str:
@@ -89,32 +241,34 @@ async def get_alerts(state: str) -> str:
     """
     # Basic input validation
     if not isinstance(state, str) or len(state) != 2 or not state.isalpha():
-        return "Error: Please provide a valid two-letter US state code (e.g., CA, NY)."
+        raise ToolError("Please provide a valid two-letter US state code (e.g., CA, NY).")
 
     state_upper = state.upper() # NWS API uses uppercase state codes
+    cached = _alerts_cache.get(state_upper)
+    if cached is not None:
+        return cached
+
     url = f"{NWS_API_BASE}/alerts/active/area/{state_upper}"
-    data = await make_nws_request(url)
+    # The decoder also checks the expected structure (NWS uses GeoJSON Features)
+    data = await make_nws_request(url, decode=_decode_alerts)
 
     # Check if the request failed
     if data is None:
-        return f"Error: Unable to fetch alerts for '{state_upper}' from the NWS API. Check server logs for details."
-
-    # Check the expected structure (NWS uses GeoJSON Features)
-    if not isinstance(data, dict) or "features" not in data or not isinstance(data["features"], list):
-        log_error(f"Unexpected data structure received for alerts/{state_upper}: {str(data)[:200]}...")
-        return f"Error: Received unexpected data format when fetching alerts for {state_upper}."
+        raise ToolError(f"Unable to fetch alerts for '{state_upper}' from the NWS API. Check server logs for details.")
 
-    features = data["features"]
+    features = data.features
     if not features:
-        return f"No active weather alerts found for {state_upper}."
+        result = f"No active weather alerts found for {state_upper}."
+        _alerts_cache.set(state_upper, result)
+        return result
 
     try:
-        alerts = [format_alert(feature) for feature in features]
-        return f"Active Alerts for {state_upper}:\n---\n" + "\n---\n".join(alerts)
+        result = f"Active Alerts for {state_upper}:\n---\n" + "\n---\n".join(map(format_alert, features))
+        _alerts_cache.set(state_upper, result)
+        return result
     except Exception as e:
-        log_error(f"Error formatting alerts for {state_upper}: {e}")
-        traceback.print_exc(file=sys.stderr)
-        return f"Error: Could not format the alert data received for {state_upper}."
+        logger.exception(f"Error formatting alerts for {state_upper}: {e}")
+        raise ToolError(f"Could not format the alert data received for {state_upper}.") from e
 
 
 @mcp.tool()
@@ -127,47 +281,52 @@ async def get_forecast(latitude: float, longitude: float) -> str:
     """
     # Validate lat/lon ranges (basic check)
     if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
-        return "Error: Invalid latitude or longitude values provided."
+        raise ToolError("Invalid latitude or longitude values provided.")
 
     # Format latitude and longitude to 4 decimal places as recommended by NWS API docs
     lat_str = f"{latitude:.4f}"
     lon_str = f"{longitude:.4f}"
     points_url = f"{NWS_API_BASE}/points/{lat_str},{lon_str}"
 
-    points_data = await make_nws_request(points_url)
+    # The points -> grid mapping is effectively static, so reuse recent lookups
+    points_key = (lat_str, lon_str)
+    properties = _points_cache.get(points_key)
+    if properties is None:
+        points_data = await make_nws_request(points_url)
 
-    if points_data is None:
-        return f"Error: Unable to get forecast grid point for location ({lat_str}, {lon_str}). The location might be outside the US or the API might be down."
-    if not isinstance(points_data, dict) or "properties" not in points_data:
-         log_error(f"Unexpected data structure received from points endpoint: {str(points_data)[:200]}...")
-         return f"Error: Received unexpected data format for location ({lat_str}, {lon_str})."
+        if points_data is None:
+            raise ToolError(f"Unable to get forecast grid point for location ({lat_str}, {lon_str}). The location might be outside the US or the API might be down.")
+        if not isinstance(points_data, dict) or "properties" not in points_data:
+             log_error(f"Unexpected data structure received from points endpoint: {str(points_data)[:200]}...")
+             raise ToolError(f"Received unexpected data format for location ({lat_str}, {lon_str}).")
 
-    properties = points_data.get("properties", {})
-    forecast_url = properties.get("forecast")
+        properties = points_data.get("properties", {})
+        if not properties.get("forecast"):
+            # NWS returns a specific error structure if the point is outside the US coverage
+            if points_data.get("status") == 404 or "is outside the NWS operational area" in points_data.get("detail", ""):
+                 raise ToolError(f"Location ({lat_str}, {lon_str}) is outside the NWS forecast coverage area (likely outside the US).")
+            log_error(f"Could not find 'forecast' URL in points data for ({lat_str}, {lon_str}). Grid: {properties.get('gridId', 'N/A')}/{properties.get('gridX', 'N/A')},{properties.get('gridY', 'N/A')}. Data: {str(points_data)[:200]}...")
+            raise ToolError(f"Could not determine the specific forecast URL for location ({lat_str}, {lon_str}).")
+        _points_cache.set(points_key, properties)
+
+    forecast_url = properties["forecast"]
     grid_id = properties.get("gridId", "N/A") # Get grid info for context
     grid_x = properties.get("gridX", "N/A")
     grid_y = properties.get("gridY", "N/A")
 
-    if not forecast_url:
-        # NWS returns a specific error structure if the point is outside the US coverage
-        if points_data.get("status") == 404 or "is outside the NWS operational area" in points_data.get("detail", ""):
-             return f"Error: Location ({lat_str}, {lon_str}) is outside the NWS forecast coverage area (likely outside the US)."
-        log_error(f"Could not find 'forecast' URL in points data for ({lat_str}, {lon_str}). Grid: {grid_id}/{grid_x},{grid_y}. Data: {str(points_data)[:200]}...")
-        return f"Error: Could not determine the specific forecast URL for location ({lat_str}, {lon_str})."
-
     # Get the actual forecast data
     forecast_data = await make_nws_request(forecast_url)
 
     if forecast_data is None:
-        return f"Error: Unable to fetch the detailed forecast from {forecast_url} (Grid: {grid_id}/{grid_x},{grid_y})."
+        raise ToolError(f"Unable to fetch the detailed forecast from {forecast_url} (Grid: {grid_id}/{grid_x},{grid_y}).")
     if not isinstance(forecast_data, dict) or "properties" not in forecast_data:
         log_error(f"Unexpected data structure received from forecast endpoint: {str(forecast_data)[:200]}...")
-        return f"Error: Received unexpected data format for the detailed forecast (Grid: {grid_id}/{grid_x},{grid_y})."
+        raise ToolError(f"Received unexpected data format for the detailed forecast (Grid: {grid_id}/{grid_x},{grid_y}).")
 
     periods = forecast_data.get("properties", {}).get("periods")
     if not isinstance(periods, list): # Check if periods is a list
         log_error(f"Forecast data for ({lat_str}, {lon_str}) is missing 'periods' list. Data: {str(forecast_data)[:200]}...")
-        return f"Error: Forecast data received for ({lat_str}, {lon_str}) is missing the forecast periods."
+        raise ToolError(f"Forecast data received for ({lat_str}, {lon_str}) is missing the forecast periods.")
     if not periods:
          return f"No forecast periods available for location ({lat_str}, {lon_str}) at this time."
 
@@ -199,9 +358,8 @@ async def get_forecast(latitude: float, longitude: float) -> str:
 
         return f"Weather forecast {location_str}:\n---\n" + "\n---\n".join(forecasts)
     except Exception as e:
-        log_error(f"Error formatting forecast periods for {location_str}: {e}")
-        traceback.print_exc(file=sys.stderr)
-        return f"Error: Could not format the forecast data received for {location_str}."
+        logger.exception(f"Error formatting forecast periods for {location_str}: {e}")
+        raise ToolError(f"Could not format the forecast data received for {location_str}.") from e
 
 
 if __name__ == "__main__":
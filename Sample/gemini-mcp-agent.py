@@ -18,6 +18,10 @@ model = ChatGoogleGenerativeAI(
     google_api_key=api_key,
 )
 
+async def ainput(prompt: str = "") -> str:
+    """Read a line from stdin in a worker thread so the event loop keeps running"""
+    return await asyncio.get_running_loop().run_in_executor(None, input, prompt)
+
 async def main():
     async with MultiServerMCPClient(
         {
@@ -42,12 +46,16 @@ async def main():
         # Initialize conversation history using simple tuples
         inputs = {"messages": []}
 
-        print("Agent is ready. Type 'exit' to quit.")
+        print("Agent is ready. Type '/reset' to clear the conversation or 'exit' to quit.")
         while True:
-            user_input = input("You: ")
+            user_input = await ainput("You: ")
             if user_input.lower() == "exit":
                 print("Exiting chat.")
                 break
+            if user_input.lower() == "/reset":
+                inputs["messages"] = []
+                print("Conversation history cleared.")
+                continue
 
             # Append user message to history
             inputs["messages"].append(("user", user_input))
@@ -58,8 +66,13 @@ async def main():
                 last_message.pretty_print()
 
             # update the inputs with the agent's response
-            inputs["messages"] == state["messages"]
+            inputs["messages"] = state["messages"]
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    try:
+        import uvloop  # Faster libuv-based event loop; not available on Windows
+    except ImportError:
+        asyncio.run(main())
+    else:
+        uvloop.run(main())
@@ -1,6 +1,8 @@
+import asyncio
+import datetime
 import socket
-import threading
 import time
+from typing import Callable, Dict
 
 # Define constants for the server address and port.  Using localhost and a non-standard port.
 SERVER_ADDRESS = '127.0.0.1'  # Localhost
@@ -9,131 +11,155 @@ SERVER_PORT = 2900  # Using a non-standard port for MCP.  MCP traditionally uses
 # -------------------
 # MCP Server Function
 # -------------------
-def mcp_server():
+async def mcp_server():
     """
     Starts a simple MCP server that listens for connections and responds to basic commands.
-    This server is multi-threaded to handle multiple clients concurrently.
+    This server uses asyncio to handle multiple clients concurrently on a single thread.
     """
-    # Create a socket object.  Use IPv4 and TCP.
-    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     try:
-        # Bind the socket to the specified address and port.
-        server_socket.bind((SERVER_ADDRESS, SERVER_PORT))
-        # Listen for incoming connections.  The '1' indicates the maximum number of queued connections.
-        server_socket.listen(1)
+        # Create a TCP server that calls handle_client for each new connection.
+        server = await asyncio.start_server(handle_client, SERVER_ADDRESS, SERVER_PORT)
         print(f"MCP Server listening on {SERVER_ADDRESS}:{SERVER_PORT}")
 
-        while True:
-            # Accept a connection from a client.  This blocks until a client connects.
-            client_socket, client_address = server_socket.accept()
-            print(f"Accepted connection from {client_address[0]}:{client_address[1]}")
-            # Create a new thread to handle the client connection.
-            client_thread = threading.Thread(target=handle_client, args=(client_socket,))
-            # Start the thread.
-            client_thread.start()
+        # Serve until cancelled.  The context manager closes the listening socket on exit.
+        async with server:
+            await server.serve_forever()
 
     except Exception as e:
         print(f"Error starting server: {e}")
     finally:
-        # Clean up the socket to prevent resource leaks.  This block will execute
-        # even if an exception occurs.
-        if server_socket:
-            server_socket.close()
-            print("Server socket closed.")
+        print("Server socket closed.")
 
 # -----------------------
 # Handle Client Function
 # -----------------------
-def handle_client(client_socket):
+async def handle_client(reader, writer):
     """
-    Handles communication with a connected client.  This function runs in a separate thread.
+    Handles communication with a connected client.  This coroutine runs as a task
+    on the server's event loop.
 
     Args:
-        client_socket: The socket object for the connected client.
+        reader: The asyncio.StreamReader for the connected client.
+        writer: The asyncio.StreamWriter for the connected client.
     """
+    client_address = writer.get_extra_info('peername')
+    print(f"Accepted connection from {client_address[0]}:{client_address[1]}")
+    # Send small replies immediately (no Nagle delay) and detect dead peers.
+    sock = writer.get_extra_info('socket')
+    if sock is not None:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
     try:
         while True:
-            # Receive data from the client.  This blocks until data is received.
-            data = client_socket.recv(1024)  # Receive up to 1024 bytes
-            if not data:
-                # If no data is received, the client has likely disconnected.
+            # Receive one newline-terminated command from the client.
+            try:
+                data = await reader.readuntil(b"\n")
+            except asyncio.IncompleteReadError:
+                # The client disconnected (possibly mid-line).
                 print("Client disconnected.")
                 break
 
-            # Decode the received data (which is in bytes) into a string.
-            message = data.decode('utf-8').strip()  # Remove leading/trailing whitespace
-            print(f"Received from client: {message}")
+            # Commands are handled as raw bytes; decode only for logging.
+            message = data.strip()  # Remove leading/trailing whitespace
+            print(f"Received from client: {message.decode('utf-8', 'replace')}")
 
-            # Process the message and generate a response.
+            # Process the message and generate an already-encoded response.
             response = process_message(message)
 
-            # Encode the response string into bytes and send it back to the client.
-            client_socket.send(response.encode('utf-8'))
+            # Send the response back to the client.
+            writer.write(response)
+            await writer.drain()
 
     except Exception as e:
         print(f"Error handling client: {e}")
     finally:
-        # Clean up the client socket.  This is important to free up resources.
-        client_socket.close()
+        # Clean up the client connection.  This is important to free up resources.
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except (ConnectionError, OSError):
+            # The peer already reset the connection; there is nothing left to close.
+            pass
 
 # -----------------------
 # Process Message Function
 # -----------------------
 
+# Each handler takes the command's argument bytes (possibly empty) and returns
+# the encoded response.  Fixed responses are encoded once, up front.
+_NO_COMMAND = b"ERROR: No command received.\n"
+_UNKNOWN_COMMAND = b"ERROR: Unknown command.\n"
+_HELLO = b"OK Hello, welcome to the server!\n"
+_PONG = b"OK PONG\n"
+_GOODBYE = b"OK Goodbye!\n"
+_NO_ECHO_TEXT = b"ERROR: No text to echo.\n"
+
+def _hello(arg):
+    if arg:
+        name = b" ".join(arg.split())  # Allow for multi-word names
+        return b"OK Hello " + name + b", welcome to the server!\n"
+    return _HELLO
+
+def _ping(arg):
+    return _PONG
+
+def _time(arg):
+    now = datetime.datetime.now()
+    return f"OK The current time is {now.strftime('%Y-%m-%d %H:%M:%S')}\n".encode('utf-8')
+
+def _bye(arg):
+    return _GOODBYE
+
+def _echo(arg):
+    if arg:
+        return b"OK " + b" ".join(arg.split()) + b"\n"
+    return _NO_ECHO_TEXT
+
+def _uptime(arg):
+    # Access the start time of the server.
+    uptime_seconds = time.time() - start_time
+    # Convert seconds to a readable format (days, hours, minutes, seconds)
+    days = int(uptime_seconds // (24 * 3600))
+    uptime_seconds %= (24 * 3600)
+    hours = int(uptime_seconds // 3600)
+    uptime_seconds %= 3600
+    minutes = int(uptime_seconds // 60)
+    seconds = int(uptime_seconds % 60)
+
+    uptime_string = f"OK Server uptime: {days} days, {hours} hours, {minutes} minutes, {seconds} seconds\n"
+    return uptime_string.encode('utf-8')
+
+# Command dispatch table, keyed by the uppercased command name.
+HANDLERS: Dict[bytes, Callable[[bytes], bytes]] = {
+    b"HELLO": _hello,
+    b"PING": _ping,
+    b"TIME": _time,
+    b"BYE": _bye,
+    b"ECHO": _echo,
+    b"UPTIME": _uptime,
+}
+
 def process_message(message):
     """
     Processes the received message and returns an appropriate response.
     This function implements the basic MCP command handling logic.
 
     Args:
-        message: The message received from the client (string).
+        message: The message received from the client (bytes).
 
     Returns:
-        The response message (string).
+        The encoded response message (bytes).
     """
     # Basic MCP command structure: <command> <argument>
-    parts = message.split()
+    parts = message.split(None, 1)
     if not parts:
-        return "ERROR: No command received.\n"
+        return _NO_COMMAND
 
     command = parts[0].upper()  # Convert to uppercase for case-insensitivity
-
-    if command == "HELLO":
-        if len(parts) > 1:
-            name = " ".join(parts[1:])  # Allow for multi-word names
-            return f"OK Hello {name}, welcome to the server!\n"
-        else:
-            return "OK Hello, welcome to the server!\n"
-    elif command == "PING":
-        return "OK PONG\n"
-    elif command == "TIME":
-        import datetime
-        now = datetime.datetime.now()
-        return f"OK The current time is {now.strftime('%Y-%m-%d %H:%M:%S')}\n"
-    elif command == "BYE":
-        return "OK Goodbye!\n"
-    elif command == "ECHO":
-        if len(parts) > 1:
-          text = " ".join(parts[1:])
-          return f"OK {text}\n"
-        else:
-          return "ERROR: No text to echo.\n"
-    elif command == "UPTIME":
-        import time
-        # Access the start time of the server.
-        uptime_seconds = time.time() - start_time
-        # Convert seconds to a readable format (days, hours, minutes, seconds)
-        days = int(uptime_seconds // (24 * 3600))
-        uptime_seconds %= (24 * 3600)
-        hours = int(uptime_seconds // 3600)
-        uptime_seconds %= 3600
-        minutes = int(uptime_seconds // 60)
-        seconds = int(uptime_seconds % 60)
-
-        uptime_string = f"OK Server uptime: {days} days, {hours} hours, {minutes} minutes, {seconds} seconds\n"
-        return uptime_string
-    else:
-        return "ERROR: Unknown command.\n"
+    handler = HANDLERS.get(command)
+    if handler is None:
+        return _UNKNOWN_COMMAND
+    return handler(parts[1] if len(parts) > 1 else b"")
 
 # -------------------
 # MCP Client Function
@@ -147,6 +173,9 @@ def mcp_client():
     try:
         # Connect to the server.
         client_socket.connect((SERVER_ADDRESS, SERVER_PORT))
+        # Send small commands immediately (no Nagle delay) and detect a dead server.
+        client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        client_socket.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
         print(f"Connected to MCP server at {SERVER_ADDRESS}:{SERVER_PORT}")
 
         while True:
@@ -155,8 +184,8 @@ def mcp_client():
             if message.lower() == 'quit':
                 break
 
-            # Send the message to the server.  Encode the string as bytes.
-            client_socket.send(message.encode('utf-8'))
+            # Send the whole message to the server.  Commands are newline-terminated.
+            client_socket.sendall((message + "\n").encode('utf-8'))
 
             # Receive the response from the server.
             data = client_socket.recv(1024)
@@ -179,7 +208,7 @@ if __name__ == "__main__":
     if role == "server":
         # Store the start time of the server
         start_time = time.time()
-        mcp_server()
+        asyncio.run(mcp_server())
     elif role == "client":
         mcp_client()
     else: